@@ -1,31 +1,56 @@
 """
 LifeOps API — FastAPI + Turso (libSQL) via Embedded Replica + Gemini Coach (Snix)
 
-- Persistência local: SQLite (DB_FILE)
+- Persistência local: SQLite (DB_FILE), WAL + pool de leitura
 - Sync opcional: Turso (TURSO_DATABASE_URL + TURSO_AUTH_TOKEN)
 - Endpoints: /state, /logs, /settings, /health, /llm/models
 - Coach IA (Snix): POST /coach/snix (Gemini via .env), com cache + retry + fallback
+- Coach IA (Snix) em streaming: POST /coach/snix/stream (SSE)
 
 Requisitos:
-- fastapi, uvicorn[standard], libsql, pydantic, python-dotenv
+- fastapi, uvicorn[standard], libsql, pydantic, python-dotenv, numpy
 """
 
+from __future__ import annotations
+
 import os
+import io
+import asyncio
+import base64
+import hashlib
+import re
+import struct
 import json
+import queue
+import random
 import threading
 import time
-import random
-from typing import Any, Dict, Optional, List, Tuple
-from datetime import datetime, date, timedelta
-
-import libsql
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, Optional, List, Tuple, Type, TypeVar
+from datetime import date
+from email.utils import parsedate_to_datetime
+
+import numpy as np
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, ConfigDict
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
 
-from urllib import request as urlrequest
+import http.client
 from urllib.error import URLError, HTTPError
+from urllib.parse import unquote, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+if TYPE_CHECKING:
+    # Só para as anotações; o import real fica em _connect (cold start mais leve)
+    import libsql
 
 # ============================================================
 # Carrega .env
@@ -38,6 +63,18 @@ load_dotenv()
 DB_FILE = os.getenv("DB_FILE", "./data/lifeops.db")
 TURSO_URL = os.getenv("TURSO_DATABASE_URL")
 TURSO_TOKEN = os.getenv("TURSO_AUTH_TOKEN")
+DB_READ_POOL_SIZE = max(1, int(os.getenv("DB_READ_POOL_SIZE", str(os.cpu_count() or 4))))
+
+# PRAGMAs aplicados em toda conexão (WAL + fsync relaxado + cache em memória)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-20000;",
+    "PRAGMA mmap_size=268435456;",  # 256 MiB: leituras via mmap, sem cópia pro page cache
+    "PRAGMA foreign_keys=ON;",
+)
 
 DEFAULT_GOALS = {
     "sleepMin": 7.0,
@@ -55,10 +92,22 @@ GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googl
 
 # Resiliência LLM
 SNIX_CACHE_TTL_SEC = int(os.getenv("SNIX_CACHE_TTL_SEC", "900"))  # 15 min
+SNIX_CACHE_MAX_ITEMS = int(os.getenv("SNIX_CACHE_MAX_ITEMS", "256")) # LRU: descarta as mais antigas
 SNIX_RETRIES = int(os.getenv("SNIX_RETRIES", "3"))               # tentativas em 429/5xx
 SNIX_BACKOFF_BASE = float(os.getenv("SNIX_BACKOFF_BASE", "0.8")) # base do backoff
 SNIX_BACKOFF_CAP = float(os.getenv("SNIX_BACKOFF_CAP", "8.0"))   # teto do backoff
 SNIX_MAX_OUTPUT_TOKENS = int(os.getenv("SNIX_MAX_OUTPUT_TOKENS", "800"))
+SNIX_NOTES_BUDGET_CHARS = int(os.getenv("SNIX_NOTES_BUDGET_CHARS", "2400"))  # teto de notas/tipo de treino no prompt
+
+# Rate limit proativo (token bucket) — 0 desativa
+SNIX_RPM = float(os.getenv("SNIX_RPM", "10"))       # requisições/min
+SNIX_TPM = float(os.getenv("SNIX_TPM", "250000"))   # tokens de entrada/min (estimado)
+
+# Concorrência máxima de chamadas ao Gemini; NON_BLOCKING=1 responde 429 em vez de enfileirar
+SNIX_MAX_CONCURRENCY = max(1, int(os.getenv("SNIX_MAX_CONCURRENCY", "4")))
+GEMINI_MODELS_CACHE_SEC = max(1, int(os.getenv("GEMINI_MODELS_CACHE_SEC", "3600")))  # catálogo quase não muda
+GEMINI_HTTP_POOL_SIZE = max(1, int(os.getenv("GEMINI_HTTP_POOL_SIZE", "8")))  # conexões keep-alive
+SNIX_NON_BLOCKING = os.getenv("SNIX_NON_BLOCKING", "0").strip().lower() in ("1", "true", "yes")
 
 # ============================================================
 # App
@@ -70,14 +119,57 @@ app.add_middleware(
     allow_origins=["*"],   # DEV ok. Produção: restrinja.
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # o front pode reenviar em If-None-Match
 )
 
-_conn: Optional[libsql.Connection] = None
-_lock = threading.Lock()
 
-# Cache simples em memória (por processo)
+class _TTLCache:
+    """
+    LRU limitado (maxsize) com expiração opcional (ttl em segundos; None = sem TTL).
+    Sem lock próprio: quem usa segura o lock do seu cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self._d: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._max = max(1, int(maxsize))
+        self._ttl = ttl
+
+    def get(self, key: Any) -> Any:
+        hit = self._d.get(key)
+        if hit is None:
+            return None
+        ts, value = hit
+        if self._ttl is not None and (time.time() - ts) > self._ttl:
+            self._d.pop(key, None)
+            return None
+        self._d.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        self._d[key] = (time.time(), value)
+        self._d.move_to_end(key)
+        while len(self._d) > self._max:
+            self._d.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._d)
+
+
+# 1 conexão de escrita (serializada pelo lock) + pool de leitura (WAL: leitores não bloqueiam)
+_write_conn: Optional[libsql.Connection] = None
+_write_lock = threading.Lock()
+_read_pool: "queue.Queue[libsql.Connection]" = queue.Queue()
+
+# Cache do corpo serializado de /state (validado por max(date)+count+state; zerado nas escritas)
+_state_cache_lock = threading.Lock()
+_state_cache: Dict[str, Any] = {"etag": None, "body": None}
+
+# Cache LRU em memória (por processo) + singleflight (1 chamada ao Gemini por chave)
 _snix_cache_lock = threading.Lock()
-_snix_cache: Dict[str, Dict[str, Any]] = {}  # key -> {"ts": float, "value": SnixCoachOut dict}
+_snix_cache = _TTLCache(SNIX_CACHE_MAX_ITEMS, SNIX_CACHE_TTL_SEC)  # cache_id -> {"value": SnixCoachOut, "body", "etag"}
+_snix_inflight: Dict[bytes, threading.Event] = {}
+# Relatórios do LLM por conteúdo (janela + foco, sem days): days=20 e 21 com a mesma janela reaproveitam
+_snix_reports = _TTLCache(SNIX_CACHE_MAX_ITEMS, SNIX_CACHE_TTL_SEC)  # report_id -> {"report", "model", "llm_meta"}
 
 
 # ============================================================
@@ -89,11 +181,36 @@ def _ensure_db_dir() -> None:
         os.makedirs(db_dir, exist_ok=True)
 
 
-def _connect() -> libsql.Connection:
+def _tune_connection(conn: libsql.Connection) -> None:
+    for pragma in SQLITE_PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except Exception:
+            # Embedded replica (Turso): alguns PRAGMAs não se aplicam; segue sem eles.
+            pass
+
+
+def _connect(read_only: bool = False) -> libsql.Connection:
+    import libsql
+
     _ensure_db_dir()
+    if read_only:
+        # Leitura direto do arquivo local (no modo Turso é a réplica sincronizada)
+        conn = libsql.connect(f"file:{os.path.abspath(DB_FILE)}?mode=ro")
+    elif TURSO_URL and TURSO_TOKEN:
+        conn = libsql.connect(DB_FILE, sync_url=TURSO_URL, auth_token=TURSO_TOKEN)
+    else:
+        conn = libsql.connect(DB_FILE)
+    _tune_connection(conn)
+    return conn
+
+
+def _begin_write(conn: libsql.Connection) -> None:
+    # Pega o lock de escrita já no início (evita SQLITE_BUSY no meio do upsert).
+    # No modo Turso a escrita é delegada ao primário, então fica no BEGIN implícito.
     if TURSO_URL and TURSO_TOKEN:
-        return libsql.connect(DB_FILE, sync_url=TURSO_URL, auth_token=TURSO_TOKEN)
-    return libsql.connect(DB_FILE)
+        return
+    conn.execute("BEGIN IMMEDIATE;")
 
 
 def _sync(conn: libsql.Connection) -> None:
@@ -134,35 +251,119 @@ def _init_schema(conn: libsql.Connection) -> None:
     conn.commit()
 
 
+def _open_db() -> libsql.Connection:
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            conn = _connect()
+            _init_schema(conn)
+            _sync(conn)
+            # O pool de leitura só abre depois do schema (mode=ro exige o arquivo pronto)
+            for _ in range(DB_READ_POOL_SIZE):
+                _read_pool.put(_connect(read_only=True))
+            _write_conn = conn
+    return _write_conn
+
+
+def _close_db() -> None:
+    global _write_conn
+    with _write_lock:
+        while True:
+            try:
+                rconn = _read_pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                rconn.close()
+            except Exception:
+                pass
+        if _write_conn is not None:
+            try:
+                _write_conn.close()
+            finally:
+                _write_conn = None
+
+
 def _require_conn() -> libsql.Connection:
-    global _conn
-    if _conn is None:
-        _conn = _connect()
-        with _lock:
-            _init_schema(_conn)
-            _sync(_conn)
-    return _conn
+    if _write_conn is None:
+        return _open_db()
+    return _write_conn
+
+
+@contextmanager
+def _read_conn() -> Iterator[libsql.Connection]:
+    """
+    Leitura sem lock: WAL deixa N leitores em paralelo com o escritor.
+    Pool esgotado => conexão avulsa (fechada no fim) em vez de enfileirar o request.
+    """
+    _require_conn()
+    try:
+        conn, pooled = _read_pool.get_nowait(), True
+    except queue.Empty:
+        conn, pooled = _connect(read_only=True), False
+    try:
+        yield conn
+    finally:
+        if pooled:
+            _read_pool.put(conn)
+        else:
+            conn.close()
 
 
 def _bool_to_int(v: bool) -> int:
     return 1 if v else 0
 
 
-def _row_to_log(r) -> Dict[str, Any]:
-    return {
-        "date": r[0],
-        "sleep": float(r[1]),
-        "sleepQual": int(r[2]),
-        "trained": bool(r[3]),
-        "trainMin": int(r[4]),
-        "trainType": r[5] or "",
-        "foodScore": int(r[6]),
-        "water": bool(r[7]),
-        "meals": bool(r[8]),
-        "mood": int(r[9]),
-        "anxiety": int(r[10]),
-        "notes": r[11] or "",
-    }
+# /state: o SQLite monta a lista de logs já tipada (JSON1), sem cast por linha em Python.
+# Mesmo shape do LogIn; booleanos saem como true/false.
+_STATE_LOGS_JSON_SQL = """
+    SELECT json_group_array(json_object(
+      'date', date,
+      'sleep', CAST(sleep AS REAL),
+      'sleepQual', sleepQual,
+      'trained', json(CASE WHEN trained != 0 THEN 'true' ELSE 'false' END),
+      'trainMin', trainMin,
+      'trainType', COALESCE(trainType, ''),
+      'foodScore', foodScore,
+      'water', json(CASE WHEN water != 0 THEN 'true' ELSE 'false' END),
+      'meals', json(CASE WHEN meals != 0 THEN 'true' ELSE 'false' END),
+      'mood', mood,
+      'anxiety', anxiety,
+      'notes', COALESCE(notes, '')
+    ))
+    FROM (SELECT * FROM logs ORDER BY date DESC);
+"""
+
+
+# Escritas: SQL fixo em constantes de módulo (o binding libsql não expõe prepare())
+_UPSERT_LOG_SQL = """
+    INSERT INTO logs (date, sleep, sleepQual, trained, trainMin, trainType, foodScore, water, meals, mood, anxiety, notes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(date) DO UPDATE SET
+      sleep=excluded.sleep,
+      sleepQual=excluded.sleepQual,
+      trained=excluded.trained,
+      trainMin=excluded.trainMin,
+      trainType=excluded.trainType,
+      foodScore=excluded.foodScore,
+      water=excluded.water,
+      meals=excluded.meals,
+      mood=excluded.mood,
+      anxiety=excluded.anxiety,
+      notes=excluded.notes;
+"""
+
+_DELETE_LOG_SQL = "DELETE FROM logs WHERE date=?;"
+
+_UPDATE_STATE_SQL = "UPDATE state SET goals_json=?, theme=? WHERE id=1;"
+
+_STATE_ROW_SQL = "SELECT goals_json, theme FROM state WHERE id=1;"
+
+# Validador barato do cache de /state
+_STATE_ETAG_SQL = """
+    SELECT MAX(date), COUNT(*), (SELECT goals_json || theme FROM state WHERE id=1)
+    FROM logs;
+"""
 
 
 def _merge_goals(goals: Optional[Dict[str, Any]]) -> Dict[str, Any]:
@@ -188,8 +389,32 @@ def _merge_goals(goals: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     }
 
 
-def _parse_yyyy_mm_dd(s: str) -> date:
-    return datetime.strptime(s, "%Y-%m-%d").date()
+@lru_cache(maxsize=4)
+def _parse_goals_cached(raw: Optional[str]) -> "MappingProxyType[str, Any]":
+    # Chaveado pelo próprio texto: salvar settings muda o texto, então não há o que invalidar
+    try:
+        goals_raw = json.loads(raw or "{}")
+    except Exception:
+        goals_raw = {}
+    return MappingProxyType(_merge_goals(goals_raw if isinstance(goals_raw, dict) else {}))
+
+
+def _parse_goals(raw: Optional[str]) -> Dict[str, Any]:
+    """goals_json cru -> metas completas. Cópia do cache (valores escalares): alterar não vaza para o próximo request."""
+    return dict(_parse_goals_cached(raw))
+
+
+_DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+
+def _validate_date(s: str) -> date:
+    """Valida YYYY-MM-DD (formato + data real) uma vez só e devolve o date."""
+    if not isinstance(s, str) or not _DATE_RE.fullmatch(s):
+        raise HTTPException(status_code=422, detail="date deve estar no formato YYYY-MM-DD.")
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"date inválida: '{s}'.")
 
 
 def _today_safe() -> date:
@@ -230,6 +455,8 @@ class SnixCoachIn(BaseModel):
 
 
 class SnixCoachOut(BaseModel):
+    # frozen: a mesma instância sai do cache para vários requests sem cópia
+    model_config = ConfigDict(frozen=True, extra="ignore")
     ok: bool
     coach: str
     model: str
@@ -239,149 +466,560 @@ class SnixCoachOut(BaseModel):
     stats: Dict[str, Any]
 
 
+_M = TypeVar("_M", bound=BaseModel)
+
+
 # ============================================================
 # Analytics
 # ============================================================
-def _pearson_corr(xs: List[float], ys: List[float]) -> Optional[float]:
-    if len(xs) != len(ys) or len(xs) < 4:
-        return None
-    n = len(xs)
-    mx = sum(xs) / n
-    my = sum(ys) / n
-    num = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
-    denx = sum((x - mx) ** 2 for x in xs) ** 0.5
-    deny = sum((y - my) ** 2 for y in ys) ** 0.5
-    if denx == 0 or deny == 0:
-        return None
-    return num / (denx * deny)
-
-
-def _summarize_window(goals: Dict[str, Any], logs: List[Dict[str, Any]]) -> Dict[str, Any]:
-    n = len(logs)
+# Colunas numéricas da janela (mesma ordem do SELECT em _SNIX_WINDOW_SQL)
+(
+    _COL_SLEEP, _COL_SLEEP_QUAL, _COL_TRAINED, _COL_TRAIN_MIN, _COL_FOOD,
+    _COL_WATER, _COL_MEALS, _COL_MOOD, _COL_ANX,
+) = range(9)
+_N_NUM_COLS = 9
+
+# Features correlacionadas contra ansiedade (nome no stats -> coluna)
+_CORR_FEATURES = (
+    ("sleep", _COL_SLEEP),
+    ("mood", _COL_MOOD),
+    ("food", _COL_FOOD),
+    ("train_min", _COL_TRAIN_MIN),
+)
+_CORR_COLS = [col for _, col in _CORR_FEATURES] + [_COL_ANX]
+
+
+class _LogWindow:
+    """
+    Janela do Snix em colunas (SoA): uma matriz float64 (n, 9) com os campos
+    numéricos + listas só para os textos. Nada de dict por linha.
+    """
+
+    __slots__ = ("dates", "num", "train_type", "notes")
+
+    def __init__(self, dates: List[str], num: np.ndarray, train_type: List[str], notes: List[str]):
+        self.dates = dates
+        self.num = num
+        self.train_type = train_type
+        self.notes = notes
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple[Any, ...]], offset: int = 0) -> "_LogWindow":
+        """Colunas do log a partir de `offset` em cada linha (transpõe uma vez, sem fatiar linha a linha)."""
+        n = len(rows)
+        if not n:
+            return cls([], np.empty((0, _N_NUM_COLS), dtype=np.float64), [], [])
+        cols = list(zip(*rows))[offset:]
+        num = np.empty((n, _N_NUM_COLS), dtype=np.float64)
+        for i in range(_N_NUM_COLS):
+            num[:, i] = np.fromiter(cols[i], dtype=np.float64, count=n)
+        return cls(
+            list(cols[_N_NUM_COLS]),
+            num,
+            [t or "" for t in cols[_N_NUM_COLS + 1]],
+            [t or "" for t in cols[_N_NUM_COLS + 2]],
+        )
+
+
+def _corr_vs_anxiety(arr: np.ndarray) -> Dict[str, Optional[float]]:
+    """Pearson de cada feature vs ansiedade, numa única chamada a np.corrcoef."""
+    if arr.shape[0] < 4:
+        return {name: None for name, _ in _CORR_FEATURES}
+
+    # Coluna constante => variância zero => NaN (tratado como "sem correlação")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.corrcoef(arr[:, _CORR_COLS], rowvar=False)
+
+    out: Dict[str, Optional[float]] = {}
+    for i, (name, _) in enumerate(_CORR_FEATURES):
+        v = corr[i, -1]
+        out[name] = round(float(v), 3) if np.isfinite(v) else None
+    return out
+
+
+def _summarize_window(goals: Dict[str, Any], window: _LogWindow) -> Dict[str, Any]:
+    n = len(window)
     anx_limit = int(goals.get("anxietyMax", 6))
 
-    sleep = [float(l.get("sleep", 0) or 0) for l in logs]
-    mood = [int(l.get("mood", 0) or 0) for l in logs]
-    anx = [int(l.get("anxiety", 0) or 0) for l in logs]
-    food = [int(l.get("foodScore", 0) or 0) for l in logs]
-    trained = [bool(l.get("trained", False)) for l in logs]
+    arr = window.num
+    means = arr.mean(axis=0)
+    anx = arr[:, _COL_ANX]
+    trained = arr[:, _COL_TRAINED] != 0
 
-    workouts = sum(1 for t in trained if t)
-    high_anx_days = sum(1 for a in anx if a > anx_limit)
+    workouts = int(trained.sum())
+    high_anx_days = int((anx > anx_limit).sum())
 
-    peak_anx = max(anx) if anx else 0
-    peak_idx = anx.index(peak_anx) if anx else 0
-    peak_date = logs[peak_idx].get("date") if logs else None
+    peak_idx = int(anx.argmax()) if n else 0
+    peak_anx = anx[peak_idx] if n else 0
+    peak_date = window.dates[peak_idx] if n else None
 
-    anx_train = [a for a, t in zip(anx, trained) if t]
-    anx_not = [a for a, t in zip(anx, trained) if not t]
     train_effect = None
-    if anx_train and anx_not:
-        train_effect = round((sum(anx_not) / len(anx_not)) - (sum(anx_train) / len(anx_train)), 3)
+    if trained.any() and not trained.all():
+        train_effect = round(float(anx[~trained].mean() - anx[trained].mean()), 3)
 
-    corr_sleep_anx = _pearson_corr(sleep, [float(a) for a in anx])
-    if corr_sleep_anx is not None:
-        corr_sleep_anx = round(corr_sleep_anx, 3)
+    corr_anx = _corr_vs_anxiety(arr)
 
-    dts = [_parse_yyyy_mm_dd(l["date"]) for l in logs]
-    start = min(dts) if dts else None
-    end = max(dts) if dts else None
+    # datas vêm ordenadas (ASC) e únicas (PK): início/fim são as pontas
+    start = window.dates[0] if n else None
+    end = window.dates[-1] if n else None
     missing = 0
-    if start and end:
-        have = set(dts)
-        cur = start
-        while cur <= end:
-            if cur not in have:
-                missing += 1
-            cur += timedelta(days=1)
+    if n:
+        span = np.datetime64(end, "D") - np.datetime64(start, "D")
+        missing = int(span.astype(np.int64)) + 1 - n
 
     trend = {}
     if n >= 6:
-        last3 = logs[-3:]
-        prev3 = logs[-6:-3]
-
-        def mean(arr, key) -> float:
-            return sum(float(x.get(key, 0) or 0) for x in arr) / len(arr)
-
+        delta = arr[-3:].mean(axis=0) - arr[-6:-3].mean(axis=0)
         trend = {
-            "anxiety_delta": round(mean(last3, "anxiety") - mean(prev3, "anxiety"), 2),
-            "sleep_delta": round(mean(last3, "sleep") - mean(prev3, "sleep"), 2),
-            "mood_delta": round(mean(last3, "mood") - mean(prev3, "mood"), 2),
+            "anxiety_delta": round(float(delta[_COL_ANX]), 2),
+            "sleep_delta": round(float(delta[_COL_SLEEP]), 2),
+            "mood_delta": round(float(delta[_COL_MOOD]), 2),
         }
 
     return {
         "n": n,
-        "window_start": start.isoformat() if start else None,
-        "window_end": end.isoformat() if end else None,
+        "window_start": start,
+        "window_end": end,
         "missing_days_in_range": missing,
         "anxiety_limit": anx_limit,
-        "avg_sleep": round(sum(sleep) / n, 2),
-        "avg_mood": round(sum(mood) / n, 2),
-        "avg_anxiety": round(sum(anx) / n, 2),
-        "avg_food": round(sum(food) / n, 2),
+        "avg_sleep": round(float(means[_COL_SLEEP]), 2),
+        "avg_mood": round(float(means[_COL_MOOD]), 2),
+        "avg_anxiety": round(float(means[_COL_ANX]), 2),
+        "avg_food": round(float(means[_COL_FOOD]), 2),
         "workouts": workouts,
         "high_anxiety_days": high_anx_days,
         "peak_anxiety": int(peak_anx),
         "peak_date": peak_date,
         "train_effect": train_effect,
-        "corr_sleep_vs_anxiety": corr_sleep_anx,
+        "corr_sleep_vs_anxiety": corr_anx["sleep"],
+        "corr_vs_anxiety": corr_anx,
         "trend": trend,
     }
 
 
-def _select_window_from_logs(logs_desc: List[Dict[str, Any]], days: int) -> Dict[str, Any]:
-    today = _today_safe()
-    past_or_today, future = [], []
+# Uma ida ao SQLite só: limites da janela (CTE) + metas + linhas da janela.
+# O LEFT JOIN garante ao menos uma linha (colunas de log NULL quando não há logs).
+# Textos já saem cortados no tamanho que o prompt usa (notas só com include_notes).
+_SNIX_WINDOW_SQL = """
+    WITH recent AS (SELECT date FROM logs ORDER BY date DESC LIMIT ?),
+    b AS (
+      SELECT
+        COUNT(*) AS n_recent,
+        COALESCE(SUM(date > ?), 0) AS future_count,
+        MAX(CASE WHEN date <= ? THEN date END) AS end_past,
+        MAX(date) AS end_any,
+        MIN(date) AS min_recent
+      FROM recent
+    ),
+    e AS (
+      SELECT *, CASE WHEN n_recent - future_count >= 3 THEN end_past ELSE end_any END AS end_date
+      FROM b
+    ),
+    w AS (SELECT *, date(end_date, ?) AS start_date FROM e)
+    SELECT
+      w.n_recent, w.future_count, w.end_date, w.start_date,
+      (SELECT goals_json FROM state WHERE id=1),
+      l.sleep, l.sleepQual, l.trained, l.trainMin, l.foodScore,
+      l.water, l.meals, l.mood, l.anxiety,
+      l.date,
+      substr(l.trainType, 1, 20),
+      CASE WHEN ? THEN substr(l.notes, 1, 200) ELSE '' END
+    FROM w
+    LEFT JOIN logs l ON l.date BETWEEN MAX(w.start_date, w.min_recent) AND w.end_date
+    ORDER BY l.date ASC;
+"""
 
-    for l in logs_desc:
-        try:
-            d = _parse_yyyy_mm_dd(l["date"])
-        except Exception:
+
+def _select_window(
+    conn: libsql.Connection, days: int, max_items: int, include_notes: bool = True
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Janela de `days` dias terminando no último log até hoje (ou no último log,
+    se houver menos de 3 no passado), sem olhar além dos max_items mais recentes.
+    Devolve (goals_json, sel) — sel é None quando não há logs.
+    """
+    today = _today_safe().isoformat()
+    rows = conn.execute(
+        _SNIX_WINDOW_SQL, (max_items, today, today, f"-{days - 1} days", int(include_notes))
+    ).fetchall()
+    n_recent, future_count, end_date, start_date, goals_json = rows[0][:5]
+    if not n_recent:
+        return goals_json, None
+
+    return goals_json, {
+        # sem logs na janela o LEFT JOIN devolve uma linha só, com o log todo NULL
+        "window": _LogWindow.from_rows(rows if rows[0][5] is not None else [], offset=5),
+        "future_count": int(future_count),
+        "used_start_date": start_date,
+        "used_end_date": end_date,
+        "used_past_only": (n_recent - future_count) >= 3,
+    }
+
+
+# ============================================================
+# Cache helpers (Snix)
+# ============================================================
+def _norm_focus(focus: str) -> str:
+    """'Ansiedade ' e 'ansiedade' são o mesmo pedido: colapsa espaços e ignora caixa."""
+    return " ".join(focus.split()).casefold()
+
+
+def _snix_window_key(
+    goals: Dict[str, Any],
+    window: _LogWindow,
+    include_notes: bool,
+) -> bytes:
+    """
+    Impressão digital (blake2b) dos dados que entram no prompt: editar um log da
+    janela ou as metas gera outra chave. Hash direto dos bytes das colunas.
+    `days` fica de fora: o prompt só vê as linhas que a janela selecionou.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(struct.pack("<?", include_notes))
+    # JSON canônico: _merge_goals aceita qualquer int (negativo, enorme), struct.pack não
+    h.update(json.dumps(goals, sort_keys=True).encode("ascii"))
+    h.update(window.num.tobytes())
+    h.update("\0".join(window.dates).encode("ascii"))
+    h.update(b"\1" + "\0".join(window.train_type).encode("utf-8"))
+    if include_notes:
+        h.update(b"\1" + "\0".join(window.notes).encode("utf-8"))
+    return h.digest()
+
+
+def _snix_key(window_id: bytes, focus: str) -> bytes:
+    """Chave do relatório: digest fixo de 16 bytes (janela + foco normalizado)."""
+    return hashlib.blake2b(window_id + _norm_focus(focus).encode("utf-8"), digest_size=16).digest()
+
+
+def _snix_response_key(report_id: bytes, days: int, max_items: int) -> bytes:
+    """Chave da resposta: o corpo ainda leva days e a seleção (start, future_count)."""
+    return hashlib.blake2b(report_id + struct.pack("<HH", days, max_items), digest_size=16).digest()
+
+
+def _render(out: SnixCoachOut) -> Dict[str, Any]:
+    """JSON pronto + ETag (hash do próprio corpo): 304 só quando o corpo seria idêntico."""
+    body = out.model_dump_json().encode("utf-8")
+    return {"body": body, "etag": f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'}
+
+
+def _cache_get_locked(key: bytes) -> Optional[Dict[str, Any]]:
+    return _snix_cache.get(key)
+
+
+def _cache_get(key: bytes) -> Optional[Dict[str, Any]]:
+    with _snix_cache_lock:
+        return _cache_get_locked(key)
+
+
+def _cache_set(key: bytes, value: SnixCoachOut) -> Dict[str, Any]:
+    # JSON serializado uma vez aqui; cache hit devolve os bytes, sem re-encode
+    item = {"value": value, **_render(value)}
+    # fallback de quota não fica no cache: passado o cooldown, o próximo request volta ao Gemini
+    if value.model == "offline-fallback":
+        return item
+    with _snix_cache_lock:
+        _snix_cache.set(key, item)
+    return item
+
+
+def _cache_get_or_compute(key: bytes, compute: Callable[[], SnixCoachOut]) -> Dict[str, Any]:
+    """
+    Singleflight: o primeiro request de uma chave calcula; os concorrentes
+    esperam o resultado em vez de chamar o Gemini de novo.
+    Se o primeiro falhar (ou cair no fallback, que não é cacheado), o próximo da fila assume o cálculo.
+    """
+    while True:
+        with _snix_cache_lock:
+            cached = _cache_get_locked(key)
+            if cached:
+                return cached
+            event = _snix_inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                _snix_inflight[key] = event
+
+        if not leader:
+            event.wait()
             continue
-        (past_or_today if d <= today else future).append(l)
 
-    base = past_or_today if len(past_or_today) >= 3 else logs_desc
-    base_sorted = sorted(base, key=lambda x: x["date"])
+        try:
+            return _cache_set(key, compute())
+        finally:
+            with _snix_cache_lock:
+                _snix_inflight.pop(key, None)
+            event.set()
+
+
+def _report_get(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Relatório já gerado para o mesmo conteúdo (janela + foco normalizado)."""
+    with _snix_cache_lock:
+        return _snix_reports.get(ctx["report_id"])
+
+
+def _report_set(ctx: Dict[str, Any], rep: Dict[str, Any]) -> None:
+    with _snix_cache_lock:
+        _snix_reports.set(ctx["report_id"], rep)
+
+
+# ============================================================
+# Rate limit (token bucket) para o Gemini
+# ============================================================
+class _GeminiBucket:
+    """
+    Token bucket simples: capacity tokens, reposição contínua de rate/min.
+    acquire() dorme até haver saldo (o request espera aqui, não no 429).
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_rate = float(per_minute) / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        if self.capacity <= 0:
+            return
+        amount = min(float(amount), self.capacity)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_s = (amount - self.tokens) / self.refill_rate
+            time.sleep(wait_s)
+
 
-    end_date = _parse_yyyy_mm_dd(base_sorted[-1]["date"])
-    start_date = end_date - timedelta(days=days - 1)
+_gemini_rpm_bucket = _GeminiBucket(SNIX_RPM)
+_gemini_tpm_bucket = _GeminiBucket(SNIX_TPM)
+_gemini_sem = threading.BoundedSemaphore(SNIX_MAX_CONCURRENCY)
 
-    window = []
-    for l in base_sorted:
+# Só o caminho lento do Snix (miss/stream) roda aqui, nunca no threadpool do AnyIO nem no
+# executor padrão. Folga de 2x: seguidores do singleflight e quem espera o semáforo também ocupam thread.
+_snix_executor = ThreadPoolExecutor(max_workers=SNIX_MAX_CONCURRENCY * 2, thread_name_prefix="snix")
+
+# Após um 429, ninguém chama o Gemini até este instante (vai direto pro fallback)
+_gemini_cooldown_until: float = 0.0
+
+
+# Sinais de quota no detail/body do Gemini (uma passada só no texto)
+_QUOTA_RE = re.compile(r" 429 |RESOURCE_EXHAUSTED|exceeded your current quota")
+
+
+class QuotaExhausted(HTTPException):
+    """Quota/rate limit do Gemini esgotado: quem chama decide pelo fallback offline."""
+
+    def __init__(self, detail: str, status_code: int = 502):
+        super().__init__(status_code=status_code, detail=detail)
+
+
+class GeminiCooldown(QuotaExhausted):
+    """Gemini em cooldown por quota: sinaliza fallback imediato, sem chamada nem retry."""
+
+    def __init__(self, remaining: float):
+        super().__init__(f"Gemini em cooldown de quota ({remaining:.0f}s restantes).", status_code=503)
+        self.remaining = remaining
+
+
+def _gemini_http_error(code: int, body: str, detail: str) -> HTTPException:
+    if code == 429 or _QUOTA_RE.search(body):
+        return QuotaExhausted(detail)
+    return HTTPException(status_code=502, detail=detail)
+
+
+def _start_gemini_cooldown(retry_after: Optional[float]) -> None:
+    global _gemini_cooldown_until
+    until = time.time() + max(retry_after or 0.0, SNIX_BACKOFF_CAP)
+    _gemini_cooldown_until = max(_gemini_cooldown_until, until)
+
+
+def _check_gemini_cooldown() -> None:
+    remaining = _gemini_cooldown_until - time.time()
+    if remaining > 0:
+        raise GeminiCooldown(remaining)
+
+
+_RETRY_DELAY_RE = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+def _estimate_tokens(*texts: str) -> int:
+    # ~4 caracteres por token (heurística da doc do Gemini)
+    return sum(len(t or "") for t in texts) // 4
+
+
+def _retry_after_seconds(e: HTTPError, body: str) -> Optional[float]:
+    """Retry-After (segundos ou HTTP-date) ou retryDelay do corpo de erro do Gemini."""
+    value = (e.headers.get("Retry-After") if e.headers else None) or ""
+    value = value.strip()
+    if value:
         try:
-            d = _parse_yyyy_mm_dd(l["date"])
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
         except Exception:
-            continue
-        if start_date <= d <= end_date:
-            window.append(l)
+            pass
 
-    return {
-        "window": window,
-        "future_count": len(future),
-        "used_start_date": start_date.isoformat(),
-        "used_end_date": end_date.isoformat(),
-        "used_past_only": len(past_or_today) >= 3,
-    }
+    m = _RETRY_DELAY_RE.search(body or "")
+    if m:
+        return float(m.group(1))
+    return None
 
 
 # ============================================================
-# Cache helpers (Snix)
+# HTTP keep-alive (Gemini) — reaproveita TLS entre chamadas
 # ============================================================
-def _cache_get(key: str) -> Optional[Dict[str, Any]]:
-    now = time.time()
-    with _snix_cache_lock:
-        item = _snix_cache.get(key)
-        if not item:
-            return None
-        if (now - float(item["ts"])) > SNIX_CACHE_TTL_SEC:
-            _snix_cache.pop(key, None)
-            return None
-        return item["value"]
+class _HTTPPool:
+    """
+    Pool de conexões http.client persistentes para um único host.
+    Mesmo contrato de erro do urlopen: status >= 400 vira HTTPError e
+    falha de rede vira URLError (o retry do Gemini continua igual).
+    Proxy como no urlopen: HTTPS_PROXY/HTTP_PROXY e NO_PROXY do ambiente (túnel CONNECT).
+    """
 
+    _STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, base_url: str, size: int):
+        parts = urlsplit((base_url or "").strip().rstrip("/"))
+        self.scheme = parts.scheme or "https"
+        self.host = parts.hostname or ""
+        self.port = parts.port
+        self.prefix = parts.path
+        self.idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=size)
+
+        proxy = None if not self.host or proxy_bypass(self.host) else getproxies().get(self.scheme)
+        self.proxy = urlsplit(proxy if "://" in proxy else f"http://{proxy}") if proxy else None
+
+    def _new_conn(self, timeout: float) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        if self.proxy is None:
+            return cls(self.host, self.port, timeout=timeout)
+
+        # TCP até o proxy, CONNECT até o host; o TLS (SNI/certificado) continua sendo do host
+        conn = cls(self.proxy.hostname, self.proxy.port or 8080, timeout=timeout)
+        tunnel_headers = {}
+        if self.proxy.username:
+            cred = f"{unquote(self.proxy.username)}:{unquote(self.proxy.password or '')}"
+            tunnel_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(cred.encode("utf-8")).decode("ascii")
+        conn.set_tunnel(self.host, self.port, headers=tunnel_headers)
+        return conn
+
+    def _checkout(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            return self._new_conn(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _checkin(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _release(self, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse) -> None:
+        # Só volta pro pool se a resposta foi lida até o fim e o servidor manteve a conexão
+        if resp.will_close or not resp.isclosed() or conn.sock is None:
+            conn.close()
+        else:
+            self._checkin(conn)
+
+    def _send(
+        self,
+        method: str,
+        target: str,
+        body: Optional[bytes],
+        headers: Optional[Dict[str, str]],
+        timeout: float,
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        for _ in range(2):
+            conn, reused = self._checkout(timeout)
+            try:
+                conn.request(method, target, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except self._STALE_ERRORS as e:
+                conn.close()
+                # Conexão ociosa fechada pelo servidor: tenta uma vez com conexão nova
+                if reused:
+                    continue
+                raise URLError(e)
+            except OSError as e:
+                conn.close()
+                raise URLError(e)
+            except Exception:
+                conn.close()
+                raise
+
+        raise URLError("conexão encerrada pelo servidor")
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 40,
+    ) -> bytes:
+        target = f"{self.prefix}{path}"
+        conn, resp = self._send(method, target, body, headers, timeout)
+        try:
+            raw = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            # timeout/reset ou corpo truncado (IncompleteRead): conexão descartada, como no stream
+            conn.close()
+            raise URLError(e)
+        self._release(conn, resp)
+
+        if resp.status >= 400:
+            url = f"{self.scheme}://{self.host}{target}"
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(raw))
+        return raw
+
+    @contextmanager
+    def stream(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 40,
+    ) -> Iterator[http.client.HTTPResponse]:
+        """Como request(), mas entrega a resposta aberta para leitura incremental."""
+        target = f"{self.prefix}{path}"
+        conn, resp = self._send(method, target, body, headers, timeout)
+
+        if resp.status >= 400:
+            try:
+                raw = resp.read()
+            except (OSError, http.client.HTTPException):
+                raw = b""
+            self._release(conn, resp)
+            url = f"{self.scheme}://{self.host}{target}"
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(raw))
 
-def _cache_set(key: str, value: Dict[str, Any]) -> None:
-    with _snix_cache_lock:
-        _snix_cache[key] = {"ts": time.time(), "value": value}
+        try:
+            yield resp
+        except (OSError, http.client.HTTPException) as e:
+            # timeout/reset ou corpo truncado (IncompleteRead) no meio da leitura
+            conn.close()
+            raise URLError(e)
+        finally:
+            self._release(conn, resp)
+
+
+_gemini_http = _HTTPPool(GEMINI_BASE_URL, GEMINI_HTTP_POOL_SIZE)
 
 
 # ============================================================
@@ -411,19 +1049,40 @@ def _validate_gemini_model_name(model: str) -> str:
     return m
 
 
+# GEMINI_MODEL é constante: valida uma vez no import. Config inválida não derruba o
+# app; o mesmo erro sai em cada request que precisar do Gemini.
+try:
+    _GEMINI_MODEL_VALIDATED: Optional[str] = _validate_gemini_model_name(GEMINI_MODEL)
+    _GEMINI_MODEL_ERROR: Optional[HTTPException] = None
+except HTTPException as _e:
+    _GEMINI_MODEL_VALIDATED, _GEMINI_MODEL_ERROR = None, _e
+
+
+def _resolve_gemini_model(model: str) -> str:
+    if model != GEMINI_MODEL:
+        return _validate_gemini_model_name(model)
+    if _GEMINI_MODEL_ERROR is not None:
+        raise HTTPException(status_code=_GEMINI_MODEL_ERROR.status_code, detail=_GEMINI_MODEL_ERROR.detail)
+    return _GEMINI_MODEL_VALIDATED
+
+
 def _gemini_list_models() -> Dict[str, Any]:
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=503, detail="GEMINI_API_KEY não configurada no .env.")
+    # Um bucket por janela de GEMINI_MODELS_CACHE_SEC: troca de bucket => nova chamada
+    return _gemini_list_models_cached(int(time.time() // GEMINI_MODELS_CACHE_SEC))
 
-    base = (GEMINI_BASE_URL or "").strip().rstrip("/")
-    url = f"{base}/models?key={GEMINI_API_KEY}"
-
-    req = urlrequest.Request(url, headers={"Accept": "application/json"}, method="GET")
 
+@lru_cache(maxsize=1)
+def _gemini_list_models_cached(bucket: int) -> Dict[str, Any]:
     try:
-        with urlrequest.urlopen(req, timeout=25) as resp:
-            raw = resp.read().decode("utf-8", errors="replace")
-            return json.loads(raw)
+        raw = _gemini_http.request(
+            "GET",
+            f"/models?key={GEMINI_API_KEY}",
+            headers={"Accept": "application/json"},
+            timeout=25,
+        ).decode("utf-8", errors="replace")
+        return json.loads(raw)
     except HTTPError as e:
         body = ""
         try:
@@ -437,6 +1096,53 @@ def _gemini_list_models() -> Dict[str, Any]:
         raise HTTPException(status_code=502, detail=f"Gemini ListModels erro inesperado: {str(e)[:200]}")
 
 
+_GEMINI_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "User-Agent": "LifeOps/1.2 (FastAPI; SnixCoach)",
+}
+
+
+_PAYLOAD_SLOT = "\0user_text\0"
+
+
+@lru_cache(maxsize=8)
+def _gemini_payload_frame(
+    system_text: str,
+    temperature: float,
+    max_output_tokens: int,
+    top_p: float,
+) -> Tuple[bytes, bytes]:
+    """
+    Partes fixas do corpo (systemInstruction + generationConfig) serializadas uma vez.
+    Devolve (antes, depois) do texto do usuário, que é a única parte que muda por request.
+    """
+    payload = {
+        "systemInstruction": {"parts": [{"text": system_text}]},
+        "contents": [{"role": "user", "parts": [{"text": _PAYLOAD_SLOT}]}],
+        "generationConfig": {
+            "temperature": float(temperature),
+            "maxOutputTokens": int(max_output_tokens),
+            "topP": float(top_p),
+        },
+    }
+    raw = json.dumps(payload)
+    slot = json.dumps(_PAYLOAD_SLOT)
+    i = raw.index(slot)
+    return raw[:i].encode("utf-8"), raw[i + len(slot):].encode("utf-8")
+
+
+def _gemini_payload(
+    system_text: str,
+    user_text: str,
+    temperature: float,
+    max_output_tokens: int,
+    top_p: float,
+) -> bytes:
+    head, tail = _gemini_payload_frame(system_text, temperature, max_output_tokens, top_p)
+    return head + json.dumps(user_text).encode("utf-8") + tail
+
+
 def _gemini_generate_once(
     system_text: str,
     user_text: str,
@@ -448,60 +1154,54 @@ def _gemini_generate_once(
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=503, detail="GEMINI_API_KEY não configurada no .env.")
 
-    model = _validate_gemini_model_name(model)
+    model = _resolve_gemini_model(model)
 
-    base = (GEMINI_BASE_URL or "").strip().rstrip("/")
-    url = f"{base}/models/{model}:generateContent?key={GEMINI_API_KEY}"
+    path = f"/models/{model}:generateContent?key={GEMINI_API_KEY}"
+    data = _gemini_payload(system_text, user_text, temperature, max_output_tokens, top_p)
 
-    payload = {
-        "systemInstruction": {"parts": [{"text": system_text}]},
-        "contents": [{"role": "user", "parts": [{"text": user_text}]}],
-        "generationConfig": {
-            "temperature": float(temperature),
-            "maxOutputTokens": int(max_output_tokens),
-            "topP": float(top_p),
-        },
-    }
+    _gemini_rpm_bucket.acquire()
+    _gemini_tpm_bucket.acquire(_estimate_tokens(system_text, user_text))
+
+    raw = _gemini_http.request("POST", path, body=data, headers=_GEMINI_HEADERS, timeout=40).decode("utf-8", errors="replace")
+    j = json.loads(raw)
 
-    data = json.dumps(payload).encode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "User-Agent": "LifeOps/1.2 (FastAPI; SnixCoach)",
-        "Connection": "close",
+    prompt_fb = j.get("promptFeedback") or {}
+    block_reason = prompt_fb.get("blockReason")
+
+    candidates = j.get("candidates") or []
+    text = ""
+    finish_reason = None
+
+    if candidates:
+        c0 = candidates[0] or {}
+        finish_reason = c0.get("finishReason")
+        content = c0.get("content") or {}
+        parts = content.get("parts") or []
+        texts: List[str] = []
+        for p in parts:
+            if isinstance(p, dict) and p.get("text"):
+                texts.append(str(p["text"]).strip())
+        text = "\n".join(t for t in texts if t).strip()
+
+    meta = {
+        "block_reason": block_reason,
+        "finish_reason": finish_reason,
+        "usage": j.get("usageMetadata"),
     }
 
-    req = urlrequest.Request(url, data=data, headers=headers, method="POST")
-
-    with urlrequest.urlopen(req, timeout=40) as resp:
-        raw = resp.read().decode("utf-8", errors="replace")
-        j = json.loads(raw)
-
-        prompt_fb = j.get("promptFeedback") or {}
-        block_reason = prompt_fb.get("blockReason")
-
-        candidates = j.get("candidates") or []
-        text = ""
-        finish_reason = None
-
-        if candidates:
-            c0 = candidates[0] or {}
-            finish_reason = c0.get("finishReason")
-            content = c0.get("content") or {}
-            parts = content.get("parts") or []
-            texts: List[str] = []
-            for p in parts:
-                if isinstance(p, dict) and p.get("text"):
-                    texts.append(str(p["text"]).strip())
-            text = "\n".join(t for t in texts if t).strip()
-
-        meta = {
-            "block_reason": block_reason,
-            "finish_reason": finish_reason,
-            "usage": j.get("usageMetadata"),
-        }
+    return {"text": text, "meta": meta, "raw_head": raw[:300]}
 
-        return {"text": text, "meta": meta, "raw_head": raw[:300]}
+
+def _acquire_gemini_permit() -> None:
+    if not SNIX_NON_BLOCKING:
+        _gemini_sem.acquire()
+        return
+    if not _gemini_sem.acquire(blocking=False):
+        raise HTTPException(
+            status_code=429,
+            detail="Snix ocupado: muitas análises em andamento. Tente novamente em instantes.",
+            headers={"Retry-After": str(max(1, int(SNIX_BACKOFF_CAP)))},
+        )
 
 
 def _gemini_generate(
@@ -516,49 +1216,141 @@ def _gemini_generate(
     Retry em:
     - 429 (quota/rate limit)
     - 500/503 (instabilidade)
+
+    No máximo SNIX_MAX_CONCURRENCY chamadas simultâneas (o permit vale também
+    durante o backoff, evitando a manada quando a janela do 429 expira).
+    """
+    global _gemini_cooldown_until
+    _check_gemini_cooldown()
+    _acquire_gemini_permit()
+    try:
+        last_err: Optional[str] = None
+
+        for attempt in range(SNIX_RETRIES + 1):
+            retry_after: Optional[float] = None
+            try:
+                out = _gemini_generate_once(
+                    system_text=system_text,
+                    user_text=user_text,
+                    model=model,
+                    temperature=temperature,
+                    max_output_tokens=max_output_tokens,
+                    top_p=top_p,
+                )
+                _gemini_cooldown_until = 0.0
+                return out
+            except HTTPError as e:
+                body = ""
+                try:
+                    body = e.read().decode("utf-8", errors="replace")
+                except Exception:
+                    pass
+
+                last_err = f"Gemini HTTPError: {e.code} {body[:300]}"
+                if e.code == 429:
+                    retry_after = _retry_after_seconds(e, body)
+                    _start_gemini_cooldown(retry_after)
+
+                # Decide se vale retry
+                retriable = e.code in (429, 500, 503)
+                if not retriable or attempt >= SNIX_RETRIES:
+                    raise _gemini_http_error(e.code, body, last_err)
+
+                if e.code == 429:
+                    # Servidor pediu espera maior que o teto: não adianta segurar o request
+                    if retry_after is not None and retry_after > SNIX_BACKOFF_CAP:
+                        raise QuotaExhausted(last_err)
+
+            except URLError as e:
+                last_err = f"Gemini URLError: {str(e)[:200]}"
+                if attempt >= SNIX_RETRIES:
+                    raise HTTPException(status_code=502, detail=last_err)
+
+            except Exception as e:
+                last_err = f"Gemini erro inesperado: {str(e)[:200]}"
+                if attempt >= SNIX_RETRIES:
+                    raise HTTPException(status_code=502, detail=last_err)
+
+            # Retry-After do servidor quando houver; senão backoff exponencial com jitter
+            if retry_after is not None:
+                sleep_s = retry_after
+            else:
+                sleep_s = min(SNIX_BACKOFF_CAP, SNIX_BACKOFF_BASE * (2 ** attempt))
+            sleep_s += random.uniform(0, 0.25)
+            time.sleep(sleep_s)
+
+        raise HTTPException(status_code=502, detail=last_err or "Falha desconhecida no Gemini.")
+    finally:
+        _gemini_sem.release()
+
+
+def _gemini_generate_stream(
+    system_text: str,
+    user_text: str,
+    model: str,
+    temperature: float = 0.35,
+    max_output_tokens: int = 800,
+    top_p: float = 0.95,
+    meta_out: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    """
+    streamGenerateContent (SSE): devolve os trechos de texto conforme chegam.
+    Sem retry (o stream já começou); erros sobem como HTTPException 502.
+    block_reason/finish_reason/usage finais são gravados em meta_out.
     """
-    last_err: Optional[str] = None
+    if not GEMINI_API_KEY:
+        raise HTTPException(status_code=503, detail="GEMINI_API_KEY não configurada no .env.")
+
+    model = _resolve_gemini_model(model)
+    path = f"/models/{model}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+    data = _gemini_payload(system_text, user_text, temperature, max_output_tokens, top_p)
+    meta = meta_out if meta_out is not None else {}
+    meta.update({"block_reason": None, "finish_reason": None, "usage": None})
+
+    _check_gemini_cooldown()
+    _acquire_gemini_permit()
+    try:
+        _gemini_rpm_bucket.acquire()
+        _gemini_tpm_bucket.acquire(_estimate_tokens(system_text, user_text))
 
-    for attempt in range(SNIX_RETRIES + 1):
         try:
-            return _gemini_generate_once(
-                system_text=system_text,
-                user_text=user_text,
-                model=model,
-                temperature=temperature,
-                max_output_tokens=max_output_tokens,
-                top_p=top_p,
-            )
+            with _gemini_http.stream("POST", path, body=data, headers=_GEMINI_HEADERS, timeout=40) as resp:
+                for line in resp:
+                    if not line.startswith(b"data:"):
+                        continue
+                    j = json.loads(line[5:].decode("utf-8", errors="replace"))
+                    if not isinstance(j, dict):
+                        continue
+
+                    block_reason = (j.get("promptFeedback") or {}).get("blockReason")
+                    if block_reason:
+                        meta["block_reason"] = block_reason
+                    if j.get("usageMetadata"):
+                        meta["usage"] = j["usageMetadata"]
+
+                    for c0 in (j.get("candidates") or [])[:1]:
+                        c0 = c0 or {}
+                        if c0.get("finishReason"):
+                            meta["finish_reason"] = c0["finishReason"]
+                        for p in (c0.get("content") or {}).get("parts") or []:
+                            if isinstance(p, dict) and p.get("text"):
+                                yield str(p["text"])
         except HTTPError as e:
             body = ""
             try:
                 body = e.read().decode("utf-8", errors="replace")
             except Exception:
                 pass
-
-            last_err = f"Gemini HTTPError: {e.code} {body[:300]}"
-
-            # Decide se vale retry
-            retriable = e.code in (429, 500, 503)
-            if not retriable or attempt >= SNIX_RETRIES:
-                raise HTTPException(status_code=502, detail=last_err)
-
+            if e.code == 429:
+                _start_gemini_cooldown(_retry_after_seconds(e, body))
+            raise _gemini_http_error(e.code, body, f"Gemini HTTPError: {e.code} {body[:300]}")
         except URLError as e:
-            last_err = f"Gemini URLError: {str(e)[:200]}"
-            if attempt >= SNIX_RETRIES:
-                raise HTTPException(status_code=502, detail=last_err)
-
-        except Exception as e:
-            last_err = f"Gemini erro inesperado: {str(e)[:200]}"
-            if attempt >= SNIX_RETRIES:
-                raise HTTPException(status_code=502, detail=last_err)
-
-        # Backoff exponencial com jitter
-        sleep_s = min(SNIX_BACKOFF_CAP, SNIX_BACKOFF_BASE * (2 ** attempt))
-        sleep_s += random.uniform(0, 0.25)
-        time.sleep(sleep_s)
-
-    raise HTTPException(status_code=502, detail=last_err or "Falha desconhecida no Gemini.")
+            raise HTTPException(status_code=502, detail=f"Gemini URLError: {str(e)[:200]}")
+        except (ValueError, OSError, http.client.HTTPException) as e:
+            # linha `data:` malformada ou falha de socket que escapou do pool
+            raise HTTPException(status_code=502, detail=f"Gemini stream interrompido: {str(e)[:200]}")
+    finally:
+        _gemini_sem.release()
 
 
 # ============================================================
@@ -615,28 +1407,43 @@ def _snix_fallback_report(stats: Dict[str, Any], focus: str) -> str:
 # ============================================================
 def _build_snix_prompt(
     goals: Dict[str, Any],
-    window: List[Dict[str, Any]],
+    window: _LogWindow,
     focus: str,
     include_notes: bool,
-) -> Tuple[str, str, Dict[str, Any]]:
-    compact = []
-    for l in window:
-        compact.append({
-            "date": l["date"],
-            "sleep_h": float(l["sleep"]),
-            "sleep_qual_1to5": int(l["sleepQual"]),
-            "trained": bool(l["trained"]),
-            "train_min": int(l.get("trainMin", 0)),
-            "train_type": (l.get("trainType") or "")[:20],
-            "food_1to5": int(l["foodScore"]),
-            "water_ok": bool(l.get("water", False)),
-            "meals_ok": bool(l.get("meals", False)),
-            "mood_0to10": int(l["mood"]),
-            "anxiety_0to10": int(l["anxiety"]),
-            "notes": ((l.get("notes") or "")[:200] if include_notes else ""),
-        })
-
-    stats = _summarize_window(goals, window)
+    stats: Dict[str, Any],
+) -> Tuple[str, str]:
+    # Linhas compactas (legenda no system_text): ~metade dos tokens do formato verboso
+    compact = [
+        {
+            "d": d,
+            "s": r[_COL_SLEEP],
+            "sq": int(r[_COL_SLEEP_QUAL]),
+            "t": int(r[_COL_TRAINED] != 0),
+            "tm": int(r[_COL_TRAIN_MIN]),
+            "fs": int(r[_COL_FOOD]),
+            "w": int(r[_COL_WATER] != 0),
+            "ml": int(r[_COL_MEALS] != 0),
+            "m": int(r[_COL_MOOD]),
+            "a": int(r[_COL_ANX]),
+        }
+        for d, r in zip(window.dates, window.num.tolist())
+    ]
+
+    # Texto livre só com include_notes e dentro do orçamento (prioriza os dias mais recentes)
+    if include_notes:
+        budget = SNIX_NOTES_BUDGET_CHARS
+        # trainType/notes já vêm cortados do SQL (20/200 chars)
+        for row, train_type, notes in zip(reversed(compact), reversed(window.train_type), reversed(window.notes)):
+            size = len(train_type) + len(notes)
+            if size == 0:
+                continue
+            if size > budget:
+                break
+            budget -= size
+            if train_type:
+                row["tt"] = train_type
+            if notes:
+                row["n"] = notes
 
     system_text = (
         "Você é o Snix, coach de hábitos guiado por dados do LifeOps.\n"
@@ -648,6 +1455,9 @@ def _build_snix_prompt(
         "- Use linguagem direta, objetiva e prática em PT-BR.\n"
         "- Baseie recomendações em stats/padrões e proponha experimentos simples.\n"
         "- Inclua no máximo 1 linha curta de humor sagaz, sem banalizar o tema.\n"
+        "Legenda de logs: d=data, s=sono (h), sq=qualidade do sono (1-5), t=treinou (0/1), "
+        "tm=min de treino, tt=tipo de treino, fs=alimentação (1-5), w=água ok (0/1), "
+        "ml=refeições ok (0/1), m=humor (0-10), a=ansiedade (0-10), n=notas.\n"
     )
 
     user_payload = {
@@ -668,7 +1478,40 @@ def _build_snix_prompt(
         "formato": "Markdown com títulos curtos e listas.",
     }
 
-    return system_text, json.dumps(user_payload, ensure_ascii=False), stats
+    return system_text, json.dumps(user_payload, ensure_ascii=False, separators=(",", ":"))
+
+
+# Stats por janela e prompt pronto por (janela, foco): a impressão digital já cobre goals, dias e notas.
+_SNIX_PROMPT_CACHE_MAX = 128
+
+_snix_prompt_lock = threading.Lock()
+_snix_stats_cache = _TTLCache(_SNIX_PROMPT_CACHE_MAX)  # window_id -> stats da janela
+_snix_prompt_cache = _TTLCache(_SNIX_PROMPT_CACHE_MAX)  # (window_id, focus) -> (system, user)
+
+
+def _snix_window_stats(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Stats da janela (entram no prompt e na resposta), calculados uma vez por window_id."""
+    with _snix_prompt_lock:
+        stats = _snix_stats_cache.get(ctx["window_id"])
+
+    if stats is None:
+        stats = _summarize_window(ctx["goals"], ctx["window"])
+        with _snix_prompt_lock:
+            _snix_stats_cache.set(ctx["window_id"], stats)
+    return stats
+
+
+def _snix_prompt(ctx: Dict[str, Any], stats: Dict[str, Any]) -> Tuple[str, str]:
+    """Monta (ou reaproveita) o prompt do ctx."""
+    key = (ctx["window_id"], ctx["focus"])
+    with _snix_prompt_lock:
+        built = _snix_prompt_cache.get(key)
+
+    if not built:
+        built = _build_snix_prompt(ctx["goals"], ctx["window"], ctx["focus"], ctx["include_notes"], stats)
+        with _snix_prompt_lock:
+            _snix_prompt_cache.set(key, built)
+    return built
 
 
 # ============================================================
@@ -676,21 +1519,12 @@ def _build_snix_prompt(
 # ============================================================
 @app.on_event("startup")
 def on_startup() -> None:
-    global _conn
-    _conn = _connect()
-    with _lock:
-        _init_schema(_conn)
-        _sync(_conn)
+    _open_db()
 
 
 @app.on_event("shutdown")
 def on_shutdown() -> None:
-    global _conn
-    if _conn is not None:
-        try:
-            _conn.close()
-        finally:
-            _conn = None
+    _close_db()
 
 
 # ============================================================
@@ -709,47 +1543,92 @@ def health():
         "gemini_base": GEMINI_BASE_URL,
         "snix_cache_ttl_sec": SNIX_CACHE_TTL_SEC,
         "snix_retries": SNIX_RETRIES,
+        "snix_cooldown_sec": round(max(0.0, _gemini_cooldown_until - time.time()), 1),
     }
 
 
 @app.get("/llm/models")
-def llm_models():
-    return _gemini_list_models()
+async def llm_models():
+    return await asyncio.to_thread(_gemini_list_models)
+
+
+def _invalidate_state_cache() -> None:
+    with _state_cache_lock:
+        _state_cache["etag"] = None
+        _state_cache["body"] = None
+
+
+def _build_state_body(conn: libsql.Connection) -> bytes:
+    row = conn.execute(_STATE_ROW_SQL).fetchone()
+    if not row:
+        raise HTTPException(status_code=500, detail="State não inicializado (id=1 ausente).")
+
+    goals = _parse_goals(row[0])
+    theme = row[1] if row[1] in ("dark", "light") else "dark"
+
+    logs_json = conn.execute(_STATE_LOGS_JSON_SQL).fetchone()[0]
+
+    # O array de logs já sai do SQLite como JSON válido: entra no corpo como está,
+    # sem json.loads + json.dumps de volta. Só goals/theme (pequenos) são serializados.
+    def dumps(v: Any) -> str:
+        return json.dumps(v, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+    return (
+        f'{{"logs":{logs_json or "[]"},"goals":{dumps(goals)},"theme":{dumps(theme)}}}'
+    ).encode("utf-8")
 
 
 @app.get("/state")
 def get_state():
-    conn = _require_conn()
+    with _read_conn() as conn:
+        etag = tuple(conn.execute(_STATE_ETAG_SQL).fetchone())
+        with _state_cache_lock:
+            if _state_cache["etag"] == etag:
+                return Response(content=_state_cache["body"], media_type="application/json")
 
-    with _lock:
-        row = conn.execute("SELECT goals_json, theme FROM state WHERE id=1;").fetchone()
-        if not row:
-            raise HTTPException(status_code=500, detail="State não inicializado (id=1 ausente).")
+        # Recalcula uma vez só: quem chega junto espera o lock e reaproveita o corpo
+        with _state_cache_lock:
+            etag = tuple(conn.execute(_STATE_ETAG_SQL).fetchone())
+            if _state_cache["etag"] != etag:
+                _state_cache["body"] = _build_state_body(conn)
+                _state_cache["etag"] = etag
+            body = _state_cache["body"]
 
-        try:
-            goals_raw = json.loads(row[0] or "{}")
-        except Exception:
-            goals_raw = {}
+    return Response(content=body, media_type="application/json")
 
-        goals = _merge_goals(goals_raw)
-        theme = row[1] if row[1] in ("dark", "light") else "dark"
 
-        logs_rows = conn.execute("""
-            SELECT date, sleep, sleepQual, trained, trainMin, trainType, foodScore, water, meals, mood, anxiety, notes
-            FROM logs
-            ORDER BY date DESC;
-        """).fetchall()
+def _parse_body(model: Type[_M], raw: bytes) -> _M:
+    """Valida o corpo cru direto no parser JSON do pydantic-core (sem json.loads + dict intermediário)."""
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        # Mantém o formato padrão de 422 do FastAPI (loc prefixado com "body")
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        )
 
-    logs: List[Dict[str, Any]] = [_row_to_log(r) for r in logs_rows]
-    return {"logs": logs, "goals": goals, "theme": theme}
 
+def _openapi_body(model: Type[BaseModel], required: bool = True) -> Dict[str, Any]:
+    # O corpo é lido cru no handler; o schema continua aparecendo no /docs
+    return {
+        "requestBody": {
+            "required": required,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
+
+
+@app.post("/logs", openapi_extra=_openapi_body(LogIn))
+async def upsert_log(request: Request):
+    payload = _parse_body(LogIn, await request.body())
+    # pool do AnyIO (o mesmo dos endpoints `def`): a escrita nunca espera atrás do Snix
+    return await run_in_threadpool(_upsert_log, payload)
 
-@app.post("/logs")
-def upsert_log(payload: LogIn):
+
+def _upsert_log(payload: LogIn) -> Dict[str, Any]:
     conn = _require_conn()
 
-    if len(payload.date) != 10 or payload.date[4] != "-" or payload.date[7] != "-":
-        raise HTTPException(status_code=422, detail="date deve estar no formato YYYY-MM-DD.")
+    _validate_date(payload.date)
 
     sleep = float(payload.sleep)
     sleep_qual = int(payload.sleepQual)
@@ -771,38 +1650,29 @@ def upsert_log(payload: LogIn):
     if train_min < 0 or train_min > 600:
         raise HTTPException(status_code=422, detail="trainMin fora do intervalo esperado (0–600).")
 
-    with _lock:
-        conn.execute("""
-        INSERT INTO logs (date, sleep, sleepQual, trained, trainMin, trainType, foodScore, water, meals, mood, anxiety, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(date) DO UPDATE SET
-          sleep=excluded.sleep,
-          sleepQual=excluded.sleepQual,
-          trained=excluded.trained,
-          trainMin=excluded.trainMin,
-          trainType=excluded.trainType,
-          foodScore=excluded.foodScore,
-          water=excluded.water,
-          meals=excluded.meals,
-          mood=excluded.mood,
-          anxiety=excluded.anxiety,
-          notes=excluded.notes;
-        """, (
-            payload.date,
-            sleep,
-            sleep_qual,
-            _bool_to_int(payload.trained),
-            train_min,
-            (payload.trainType or ""),
-            food,
-            _bool_to_int(payload.water),
-            _bool_to_int(payload.meals),
-            mood,
-            anx,
-            payload.notes or "",
-        ))
-        conn.commit()
+    with _write_lock:
+        _begin_write(conn)
+        try:
+            conn.execute(_UPSERT_LOG_SQL, (
+                payload.date,
+                sleep,
+                sleep_qual,
+                _bool_to_int(payload.trained),
+                train_min,
+                (payload.trainType or ""),
+                food,
+                _bool_to_int(payload.water),
+                _bool_to_int(payload.meals),
+                mood,
+                anx,
+                payload.notes or "",
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         _sync(conn)
+        _invalidate_state_cache()
 
     return {"ok": True}
 
@@ -811,13 +1681,18 @@ def upsert_log(payload: LogIn):
 def delete_log(date_str: str):
     conn = _require_conn()
 
-    if len(date_str) != 10 or date_str[4] != "-" or date_str[7] != "-":
-        raise HTTPException(status_code=422, detail="date deve estar no formato YYYY-MM-DD.")
+    _validate_date(date_str)
 
-    with _lock:
-        conn.execute("DELETE FROM logs WHERE date=?;", (date_str,))
-        conn.commit()
+    with _write_lock:
+        _begin_write(conn)
+        try:
+            conn.execute(_DELETE_LOG_SQL, (date_str,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         _sync(conn)
+        _invalidate_state_cache()
 
     return {"ok": True}
 
@@ -829,13 +1704,16 @@ def save_settings(payload: SettingsIn):
     merged = _merge_goals(payload.goals or {})
     theme = payload.theme if payload.theme in ("dark", "light") else "dark"
 
-    with _lock:
-        conn.execute(
-            "UPDATE state SET goals_json=?, theme=? WHERE id=1;",
-            (json.dumps(merged), theme),
-        )
-        conn.commit()
+    with _write_lock:
+        _begin_write(conn)
+        try:
+            conn.execute(_UPDATE_STATE_SQL, (json.dumps(merged), theme))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         _sync(conn)
+        _invalidate_state_cache()
 
     return {"ok": True, "goals": merged, "theme": theme}
 
@@ -843,59 +1721,126 @@ def save_settings(payload: SettingsIn):
 # ============================================================
 # Snix Coach
 # ============================================================
-@app.post("/coach/snix", response_model=SnixCoachOut)
-def snix_coach(payload: SnixCoachIn):
-    conn = _require_conn()
-
+def _snix_prepare(payload: SnixCoachIn) -> Dict[str, Any]:
+    """
+    Normaliza a entrada, lê goals + janela e calcula as chaves de cache
+    (comum a /coach/snix e /stream). Stats e prompt ficam para o miss.
+    """
     days = max(3, min(60, int(payload.days)))
     max_items = max(10, min(240, int(payload.max_items)))
     focus = (payload.focus or "ansiedade").strip()[:40]
     include_notes = bool(payload.include_notes)
 
-    with _lock:
-        row = conn.execute("SELECT goals_json, theme FROM state WHERE id=1;").fetchone()
-        if not row:
-            raise HTTPException(status_code=500, detail="State não inicializado (id=1 ausente).")
+    with _read_conn() as conn:
+        goals_json, sel = _select_window(conn, days=days, max_items=max_items, include_notes=include_notes)
 
-        try:
-            goals_raw = json.loads(row[0] or "{}")
-        except Exception:
-            goals_raw = {}
-        goals = _merge_goals(goals_raw)
-
-        rows = conn.execute("""
-            SELECT date, sleep, sleepQual, trained, trainMin, trainType, foodScore, water, meals, mood, anxiety, notes
-            FROM logs
-            ORDER BY date DESC
-            LIMIT ?;
-        """, (max_items,)).fetchall()
-
-    logs_desc = [_row_to_log(r) for r in rows]
-    if not logs_desc:
+    if goals_json is None:
+        raise HTTPException(status_code=500, detail="State não inicializado (id=1 ausente).")
+
+    goals = _parse_goals(goals_json)
+
+    if sel is None:
         raise HTTPException(status_code=422, detail="Sem logs suficientes para análise do Snix.")
 
-    sel = _select_window_from_logs(logs_desc=logs_desc, days=days)
     window = sel["window"]
     if len(window) < 3:
         raise HTTPException(status_code=422, detail="Poucos dados na janela (mínimo 3 dias).")
 
-    system_text, user_text, stats = _build_snix_prompt(goals, window, focus, include_notes)
-
-    # chave de cache: mesma janela, mesmo foco, mesmas notas => reutiliza
+    # chave legível (vai no stats) + impressão digital do conteúdo (chave real do cache)
     cache_key = f"days={days}|focus={focus}|notes={int(include_notes)}|end={sel['used_end_date']}|n={len(window)}"
-    cached = _cache_get(cache_key)
-    if cached:
-        return SnixCoachOut(**cached)
+    window_id = _snix_window_key(goals, window, include_notes)
+    report_id = _snix_key(window_id, focus)
 
-    # tenta LLM; se bater quota, devolve fallback (200 OK)
-    try:
+    return {
+        "days": days,
+        "max_items": max_items,
+        "focus": focus,
+        "include_notes": include_notes,
+        "goals": goals,
+        "sel": sel,
+        "window": window,
+        "cache_key": cache_key,
+        "window_id": window_id,
+        "report_id": report_id,
+        "cache_id": _snix_response_key(report_id, days, max_items),
+    }
+
+
+def _snix_stats_out(ctx: Dict[str, Any], stats: Dict[str, Any], llm_meta: Dict[str, Any]) -> Dict[str, Any]:
+    """stats da resposta: os da janela + seleção/chave do cache + metadados do LLM."""
+    sel = ctx["sel"]
+    return {
+        **stats,
+        "sleepMin": ctx["goals"].get("sleepMin"),
+        "window_start_selected": sel["used_start_date"],
+        "window_end_selected": sel["used_end_date"],
+        "used_past_only": sel["used_past_only"],
+        "future_count": sel["future_count"],
+        "cache_key": ctx["cache_key"],
+        "llm_meta": llm_meta,
+    }
+
+
+def _make_out(ctx: Dict[str, Any], *, model: str, report: str, stats_out: Dict[str, Any]) -> SnixCoachOut:
+    """Resposta do Snix (sucesso e fallback). Campos já tipados aqui: sem validação (model_construct)."""
+    return SnixCoachOut.model_construct(
+        ok=True,
+        coach="Snix",
+        model=model,
+        days=ctx["days"],
+        n_logs_used=len(ctx["window"]),
+        report=report,
+        stats=stats_out,
+    )
+
+
+def _quota_meta(e: QuotaExhausted) -> Dict[str, Any]:
+    if isinstance(e, GeminiCooldown):
+        return {"error": "quota_cooldown", "retry_in_sec": round(e.remaining, 1)}
+    return {"error": "quota_exhausted"}
+
+
+# Mesma configuração de geração em /coach/snix e /stream (o frame do payload fica em cache)
+_SNIX_GENERATION: Dict[str, Any] = {
+    "temperature": 0.35,
+    "max_output_tokens": SNIX_MAX_OUTPUT_TOKENS,
+    "top_p": 0.95,
+}
+
+_SNIX_FUTURE_NOTE = (
+    "\n\nNota técnica: detectei registros em datas futuras. "
+    "A inferência prioriza dados até a data atual; o futuro é melhor como planejamento."
+)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+@app.post("/coach/snix", response_model=SnixCoachOut, openapi_extra=_openapi_body(SnixCoachIn, required=False))
+async def snix_coach(request: Request):
+    # todos os campos têm default: corpo vazio equivale a {}
+    payload = _parse_body(SnixCoachIn, await request.body() or b"{}")
+
+    def _prepare_and_lookup() -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        ctx = _snix_prepare(payload)
+        return ctx, _cache_get(ctx["cache_id"])
+
+    # janela + lookup são rápidos: pool do AnyIO, como /state
+    ctx, rendered = await run_in_threadpool(_prepare_and_lookup)
+    focus, sel = ctx["focus"], ctx["sel"]
+
+    def _generate(stats: Dict[str, Any]) -> Dict[str, Any]:
+        system_text, user_text = _snix_prompt(ctx, stats)
         out = _gemini_generate(
             system_text=system_text,
             user_text=user_text,
             model=GEMINI_MODEL,
-            temperature=0.35,
-            max_output_tokens=SNIX_MAX_OUTPUT_TOKENS,
-            top_p=0.95,
+            **_SNIX_GENERATION,
         )
 
         report = (out.get("text") or "").strip()
@@ -912,66 +1857,124 @@ def snix_coach(payload: SnixCoachIn):
                 "Aumente a janela (ex.: 21 dias) ou reduza notas (include_notes=false)."
             )
 
-        if sel["future_count"] > 0:
-            report += (
-                "\n\nNota técnica: detectei registros em datas futuras. "
-                "A inferência prioriza dados até a data atual; o futuro é melhor como planejamento."
+        rep = {"report": report, "model": _resolve_gemini_model(GEMINI_MODEL), "llm_meta": meta}
+        _report_set(ctx, rep)
+        return rep
+
+    def _compute() -> SnixCoachOut:
+        stats = _snix_window_stats(ctx)
+        # Mesma janela + foco já gerou relatório (mesmo com outro days)? Não chama o LLM.
+        try:
+            rep = _report_get(ctx) or _generate(stats)
+        except QuotaExhausted as e:
+            # quota: fallback offline (200 OK); outros HTTPException sobem direto
+            stats_out = _snix_stats_out(ctx, stats, _quota_meta(e))
+            return _make_out(
+                ctx,
+                model="offline-fallback",
+                report=_snix_fallback_report(stats_out, focus),
+                stats_out=stats_out,
             )
 
-        stats_out = {
-            **stats,
-            "sleepMin": goals.get("sleepMin"),
-            "window_start_selected": sel["used_start_date"],
-            "window_end_selected": sel["used_end_date"],
-            "used_past_only": sel["used_past_only"],
-            "future_count": sel["future_count"],
-            "llm_meta": meta,
-            "cache_key": cache_key,
-        }
+        report = rep["report"]
+        if sel["future_count"] > 0:
+            report += _SNIX_FUTURE_NOTE
+        return _make_out(ctx, model=rep["model"], report=report, stats_out=_snix_stats_out(ctx, stats, rep["llm_meta"]))
+
+    # JSON pronto do cache (validado/serializado uma vez só, no miss);
+    # só o miss (Gemini síncrono) vai para o executor dedicado
+    if rendered is None:
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(_snix_executor, _cache_get_or_compute, ctx["cache_id"], _compute)
+    fallback = rendered["value"].model == "offline-fallback"
+    headers = {"ETag": rendered["etag"], "Cache-Control": "no-store" if fallback else "private, max-age=60"}
+    if _etag_matches(request.headers.get("if-none-match"), rendered["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=rendered["body"], media_type="application/json", headers=headers)
+
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _iterate_on_snix_executor(gen: Iterator[str]) -> AsyncIterator[str]:
+    """Consome um gerador síncrono (bloqueante) no `_snix_executor`, um `next()` por vez."""
+    done = object()
+    fut = None
+    try:
+        while True:
+            fut = _snix_executor.submit(next, gen, done)
+            chunk = await asyncio.wrap_future(fut)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        # cliente caiu no meio de um next(): fecha o gerador (e a conexão) quando ele terminar
+        if fut is None:
+            gen.close()
+        else:
+            fut.add_done_callback(lambda _: gen.close())
+
+
+@app.post("/coach/snix/stream", openapi_extra=_openapi_body(SnixCoachIn, required=False))
+async def snix_coach_stream(request: Request):
+    """
+    Mesmo Snix, via SSE: eventos `data: {"text": ...}` conforme o Gemini gera,
+    e um `event: done` final com model/stats. Sem cache (use /coach/snix).
+    """
+    payload = _parse_body(SnixCoachIn, await request.body() or b"{}")
+    ctx = await run_in_threadpool(_snix_prepare, payload)
 
-        result = SnixCoachOut(
-            ok=True,
-            coach="Snix",
-            model=_validate_gemini_model_name(GEMINI_MODEL),
-            days=days,
-            n_logs_used=len(window),
-            report=report,
-            stats=stats_out,
-        ).model_dump()
-
-        _cache_set(cache_key, result)
-        return SnixCoachOut(**result)
-
-    except HTTPException as e:
-        # Se for quota (429) ela vem encapsulada como 502 detail "... 429 ..."
-        detail = str(e.detail or "")
-        is_quota = (" 429 " in detail) or ("RESOURCE_EXHAUSTED" in detail) or ("exceeded your current quota" in detail)
-
-        if is_quota:
-            stats_out = {
-                **stats,
-                "sleepMin": goals.get("sleepMin"),
-                "window_start_selected": sel["used_start_date"],
-                "window_end_selected": sel["used_end_date"],
-                "used_past_only": sel["used_past_only"],
-                "future_count": sel["future_count"],
-                "llm_meta": {"error": "quota_exhausted"},
-                "cache_key": cache_key,
-            }
-
-            report = _snix_fallback_report(stats_out, focus)
-            result = SnixCoachOut(
-                ok=True,
-                coach="Snix",
-                model="offline-fallback",
-                days=days,
-                n_logs_used=len(window),
-                report=report,
-                stats=stats_out,
-            ).model_dump()
+    def _events() -> Iterator[str]:
+        stats = _snix_window_stats(ctx)
+        system_text, user_text = _snix_prompt(ctx, stats)
+        meta: Dict[str, Any] = {}
+        got_text = False
+
+        try:
+            # dentro do try: modelo inválido vira `event: error` (os headers 200 já foram)
+            model = _resolve_gemini_model(GEMINI_MODEL)
+            for chunk in _gemini_generate_stream(
+                system_text=system_text,
+                user_text=user_text,
+                model=GEMINI_MODEL,
+                **_SNIX_GENERATION,
+                meta_out=meta,
+            ):
+                got_text = got_text or bool(chunk.strip())
+                yield _sse({"text": chunk})
+        except QuotaExhausted as e:
+            meta = _quota_meta(e)
+            model = "offline-fallback"
+            stats_out = _snix_stats_out(ctx, stats, meta)
+            yield _sse({"text": _snix_fallback_report(stats_out, ctx["focus"])})
+            got_text = True
+        except HTTPException as e:
+            yield _sse({"detail": str(e.detail or "")}, event="error")
+            return
+
+        if meta.get("block_reason"):
+            yield _sse({"text": (
+                "Sem resposta do Snix: a API bloqueou o conteúdo desta solicitação.\n"
+                "Tente foco diferente (ex.: 'sono', 'rotina') ou desative include_notes."
+            )})
+        elif not got_text:
+            yield _sse({"text": (
+                "Sem resposta do Snix (texto vazio).\n"
+                "Aumente a janela (ex.: 21 dias) ou reduza notas (include_notes=false)."
+            )})
+
+        if ctx["sel"]["future_count"] > 0 and model != "offline-fallback":
+            yield _sse({"text": _SNIX_FUTURE_NOTE})
 
-            _cache_set(cache_key, result)
-            return SnixCoachOut(**result)
+        yield _sse({
+            "ok": True,
+            "coach": "Snix",
+            "model": model,
+            "days": ctx["days"],
+            "n_logs_used": len(ctx["window"]),
+            "stats": _snix_stats_out(ctx, stats, meta),
+        }, event="done")
 
-        # outros erros: sobe mesmo
-        raise
+    return StreamingResponse(_iterate_on_snix_executor(_events()), media_type="text/event-stream")
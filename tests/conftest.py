@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+# Config antes do import: main.py lê o ambiente no carregamento do módulo
+os.environ["DB_FILE"] = os.path.join(tempfile.mkdtemp(prefix="lifeops-tests-"), "lifeops.db")
+os.environ["GEMINI_API_KEY"] = "test-key"
+os.environ["TURSO_DATABASE_URL"] = ""
+os.environ["TURSO_AUTH_TOKEN"] = ""
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """App com banco novo e caches do Snix zerados a cada teste."""
+    monkeypatch.setattr(main, "DB_FILE", str(tmp_path / "lifeops.db"))
+    monkeypatch.setattr(main, "_snix_cache", main._TTLCache(main.SNIX_CACHE_MAX_ITEMS, main.SNIX_CACHE_TTL_SEC))
+    monkeypatch.setattr(main, "_snix_reports", main._TTLCache(main.SNIX_CACHE_MAX_ITEMS, main.SNIX_CACHE_TTL_SEC))
+    monkeypatch.setattr(main, "_snix_stats_cache", main._TTLCache(main._SNIX_PROMPT_CACHE_MAX))
+    monkeypatch.setattr(main, "_snix_prompt_cache", main._TTLCache(main._SNIX_PROMPT_CACHE_MAX))
+    monkeypatch.setattr(main, "_gemini_cooldown_until", 0.0)
+    main._invalidate_state_cache()
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Gemini falso: conta chamadas e devolve sempre o mesmo relatório."""
+    calls = []
+
+    def fake_once(**kwargs):
+        calls.append(kwargs)
+        return {"text": "relatorio", "meta": {"block_reason": None, "finish_reason": "STOP", "usage": {}}, "raw_head": ""}
+
+    def fake_stream(meta_out=None, **kwargs):
+        calls.append(kwargs)
+        if meta_out is not None:
+            meta_out.update({"block_reason": None, "finish_reason": "STOP", "usage": {}})
+        yield "relatorio"
+
+    monkeypatch.setattr(main, "_gemini_generate_once", fake_once)
+    monkeypatch.setattr(main, "_gemini_generate_stream", fake_stream)
+    return calls
+
+
+def make_log(offset=0, **overrides):
+    """Log válido para hoje + `offset` dias."""
+    log = {
+        "date": (date.today() + timedelta(days=offset)).isoformat(),
+        "sleep": 7.0,
+        "sleepQual": 3,
+        "trained": offset % 2 == 0,
+        "trainMin": 30,
+        "trainType": "forca",
+        "foodScore": 3,
+        "water": True,
+        "meals": True,
+        "mood": 6,
+        "anxiety": 4,
+        "notes": "",
+    }
+    log.update(overrides)
+    return log
+
+
+def seed_logs(client, n=7, **overrides):
+    """n logs seguidos terminando hoje."""
+    for i in range(n):
+        r = client.post("/logs", json=make_log(-i, **overrides))
+        assert r.status_code == 200, r.text
@@ -0,0 +1,44 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+import main
+from conftest import make_log, seed_logs
+
+
+def _run_blocked(request, executors=()):
+    """Executa `request(ac)` com o executor padrão do asyncio (e `executors`) ocupados."""
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        blockers = [loop.run_in_executor(None, time.sleep, 1.5)]
+        for ex in executors:
+            blockers += [loop.run_in_executor(ex, time.sleep, 1.5) for _ in range(ex._max_workers)]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            t0 = time.perf_counter()
+            r = await request(ac)
+            elapsed = time.perf_counter() - t0
+        await asyncio.gather(*blockers)
+        return r, elapsed
+
+    return asyncio.run(run())
+
+
+def test_log_write_does_not_wait_behind_the_default_executor(client):
+    r, elapsed = _run_blocked(lambda ac: ac.post("/logs", json=make_log(0)))
+    assert r.status_code == 200
+    assert elapsed < 1.0
+
+
+def test_snix_cache_hit_does_not_wait_behind_misses(client, gemini):
+    seed_logs(client)
+    assert client.post("/coach/snix", json={"days": 14}).status_code == 200
+
+    r, elapsed = _run_blocked(lambda ac: ac.post("/coach/snix", json={"days": 14}), [main._snix_executor])
+    assert r.status_code == 200
+    assert elapsed < 1.0
+    assert len(gemini) == 1
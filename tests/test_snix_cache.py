@@ -0,0 +1,120 @@
+import pytest
+
+import main
+from conftest import make_log, seed_logs
+
+
+def _prepare(**kwargs):
+    return main._snix_prepare(main.SnixCoachIn(**kwargs))
+
+
+@pytest.mark.parametrize("goals", [
+    {"workoutsPerWeek": -1},
+    {"anxietyMax": 70000},
+    {"foodTarget": 10 ** 30},
+])
+def test_snix_accepts_out_of_range_goals(client, gemini, goals):
+    seed_logs(client)
+    assert client.put("/settings", json={"goals": goals}).status_code == 200
+
+    assert client.post("/coach/snix", json={"days": 14}).status_code == 200
+    assert client.post("/coach/snix/stream", json={"days": 14}).status_code == 200
+
+
+def test_parsed_goals_are_not_shared():
+    raw = '{"sleepMin": 8}'
+    goals = main._parse_goals(raw)
+    goals["sleepMin"] = 1
+    assert main._parse_goals(raw)["sleepMin"] == 8
+
+
+def test_log_edit_in_window_misses_the_cache(client, gemini):
+    seed_logs(client)
+    client.post("/coach/snix", json={"days": 14})
+    client.post("/coach/snix", json={"days": 14})
+    assert len(gemini) == 1
+
+    client.post("/logs", json=make_log(0, anxiety=9))
+    client.post("/coach/snix", json={"days": 14})
+    assert len(gemini) == 2
+
+
+def test_quota_fallback_is_not_cached(client, gemini, monkeypatch):
+    seed_logs(client)
+    monkeypatch.setattr(main, "_gemini_cooldown_until", main.time.time() + 8)
+
+    r = client.post("/coach/snix", json={"days": 14})
+    assert r.status_code == 200
+    assert r.json()["model"] == "offline-fallback"
+    assert r.headers["cache-control"] == "no-store"
+    assert gemini == []
+
+    # cooldown terminou: o mesmo pedido volta ao Gemini em vez de servir o fallback
+    monkeypatch.setattr(main, "_gemini_cooldown_until", 0.0)
+    r = client.post("/coach/snix", json={"days": 14})
+    assert r.json()["model"] == main.GEMINI_MODEL
+    assert len(gemini) == 1
+
+
+def test_focus_is_normalized(client, gemini):
+    seed_logs(client)
+    for focus in ("Ansiedade", "ansiedade ", "  ANSIEDADE"):
+        r = client.post("/coach/snix", json={"days": 14, "focus": focus})
+        assert r.status_code == 200
+    assert len(gemini) == 1
+
+    client.post("/coach/snix", json={"days": 14, "focus": "sono"})
+    assert len(gemini) == 2
+
+
+def test_cache_keys_are_stable(client):
+    seed_logs(client)
+    a = _prepare(days=14, focus="Ansiedade ")
+    assert a["report_id"] == _prepare(days=14, focus="ansiedade")["report_id"]
+    assert len(a["report_id"]) == len(a["cache_id"]) == 16
+
+    # days pesa só na resposta: a mesma janela gera o mesmo relatório
+    b = _prepare(days=21, focus="ansiedade")
+    assert b["report_id"] == a["report_id"] and b["cache_id"] != a["cache_id"]
+
+    assert _prepare(days=14, include_notes=False)["window_id"] != a["window_id"]
+
+    client.post("/logs", json=make_log(0, anxiety=9))
+    assert _prepare(days=14, focus="ansiedade")["report_id"] != a["report_id"]
+    client.put("/settings", json={"goals": {"sleepMin": 8}})
+    assert _prepare(days=14, focus="ansiedade")["window_id"] != a["window_id"]
+
+
+def test_report_is_reused_across_days(client, gemini):
+    seed_logs(client)
+    a = client.post("/coach/snix", json={"days": 20}).json()
+    b = client.post("/coach/snix", json={"days": 21}).json()
+    assert len(gemini) == 1
+    assert a["report"] == b["report"]
+    assert (a["days"], b["days"]) == (20, 21)
+    # reaproveitado sem chamar o LLM, mas com os stats completos da janela (só a seleção muda)
+    for k in ("cache_key", "window_start_selected"):
+        a["stats"].pop(k), b["stats"].pop(k)
+    assert a["stats"] == b["stats"]
+
+    client.post("/coach/snix", json={"days": 21, "focus": "sono"})
+    assert len(gemini) == 2
+
+
+def test_if_none_match_returns_304(client, gemini):
+    seed_logs(client)
+    r = client.post("/coach/snix", json={"days": 14})
+    etag = r.headers["etag"]
+    assert r.status_code == 200 and etag
+
+    r = client.post("/coach/snix", json={"days": 14}, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b""
+    assert r.headers["etag"] == etag
+    r = client.post("/coach/snix", json={"days": 14}, headers={"If-None-Match": f'W/{etag}, "outro"'})
+    assert r.status_code == 304
+
+    # log novo na janela: corpo muda, ETag também
+    client.post("/logs", json=make_log(0, anxiety=9))
+    r = client.post("/coach/snix", json={"days": 14}, headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+    assert len(gemini) == 2
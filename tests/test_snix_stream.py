@@ -0,0 +1,59 @@
+import http.client
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from conftest import seed_logs
+
+
+def test_stream_invalid_model_is_an_error_event(client, gemini, monkeypatch):
+    seed_logs(client)
+    monkeypatch.setattr(main, "_GEMINI_MODEL_ERROR", HTTPException(status_code=502, detail="modelo inválido"))
+
+    assert client.post("/coach/snix", json={"days": 14}).status_code == 502
+
+    r = client.post("/coach/snix/stream", json={"days": 14})
+    assert r.status_code == 200
+    assert "event: error" in r.text and "modelo inválido" in r.text
+
+
+class _FakeConn:
+    def close(self):
+        pass
+
+
+class _FakeResp:
+    """Resposta SSE do Gemini que quebra depois do primeiro trecho."""
+
+    status = 200
+    will_close = True
+
+    def __init__(self, tail):
+        self._tail = tail
+
+    def __iter__(self):
+        yield b'data: {"candidates": [{"content": {"parts": [{"text": "parcial"}]}}]}\n'
+        if isinstance(self._tail, Exception):
+            raise self._tail
+        yield self._tail
+
+    def isclosed(self):
+        return False
+
+
+@pytest.mark.parametrize("tail", [
+    b"data: {nao-e-json\n",
+    TimeoutError("timed out"),
+    ConnectionResetError("reset"),
+    http.client.IncompleteRead(b""),
+])
+def test_stream_read_failure_is_an_error_event(client, monkeypatch, tail):
+    seed_logs(client)
+    monkeypatch.setattr(main._HTTPPool, "_send", lambda self, *a, **k: (_FakeConn(), _FakeResp(tail)))
+
+    r = client.post("/coach/snix/stream", json={"days": 14})
+    assert r.status_code == 200
+    assert "parcial" in r.text
+    assert "event: error" in r.text
+    assert "event: done" not in r.text
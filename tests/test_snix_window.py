@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import main
+from conftest import make_log
+
+
+def _select(days=14, max_items=60, include_notes=True):
+    with main._read_conn() as conn:
+        return main._select_window(conn, days=days, max_items=max_items, include_notes=include_notes)
+
+
+def _post(client, log):
+    r = client.post("/logs", json=log)
+    assert r.status_code == 200, r.text
+
+
+def test_window_ends_on_last_past_log_and_counts_future(client):
+    today = date.today()
+    for offset in (0, -1, -2, -3, -20, 2):
+        _post(client, make_log(offset))
+
+    goals_json, sel = _select(days=14)
+    assert goals_json is not None
+    assert sel["used_end_date"] == today.isoformat()
+    assert sel["used_start_date"] == (today - timedelta(days=13)).isoformat()
+    assert sel["future_count"] == 1 and sel["used_past_only"]
+    # fora da janela (-20) e no futuro (+2) ficam de fora
+    assert sel["window"].dates == [(today - timedelta(days=d)).isoformat() for d in (3, 2, 1, 0)]
+
+
+def test_window_falls_back_to_future_logs_with_little_past(client):
+    for offset in (0, 1, 2):
+        _post(client, make_log(offset))
+
+    _, sel = _select(days=14)
+    assert sel["used_end_date"] == (date.today() + timedelta(days=2)).isoformat()
+    assert not sel["used_past_only"]
+    assert len(sel["window"]) == 3
+
+
+def test_window_respects_max_items_truncates_text_and_drops_notes(client):
+    for offset in range(-14, 1):
+        _post(client, make_log(offset, notes="n" * 300, trainType="t" * 30))
+
+    _, sel = _select(days=30, max_items=10)
+    window = sel["window"]
+    assert len(window) == 10
+    assert window.dates[-1] == date.today().isoformat()
+    assert all(len(n) == 200 for n in window.notes)
+    assert all(len(t) == 20 for t in window.train_type)
+    assert window.num.shape == (10, main._N_NUM_COLS)
+
+    _, sel = _select(days=30, max_items=10, include_notes=False)
+    assert sel["window"].notes == [""] * 10
+
+
+def test_window_without_logs(client):
+    goals_json, sel = _select()
+    assert goals_json is not None and sel is None